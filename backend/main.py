@@ -1,20 +1,44 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional
+from contextlib import asynccontextmanager
 import uuid
+import orjson
 import logging
 from datetime import datetime
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from multi_agent_system import generate_anki_cards
+from multi_agent_system import generate_anki_cards, stream_anki_cards, get_http_session, close_http_session
+from redis_client import get_redis, close_redis, save_job, load_job
+from worker import generate_flashcards_task, job_priority
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Multi-Agent Flashcard API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the pooled aiohttp session once so every Ollama call reuses
+    # warm keep-alive connections instead of a fresh TCP handshake.
+    app.state.http = get_http_session()
+    # Job state lives in Redis so it survives restarts and is shared
+    # across uvicorn workers.
+    app.state.redis = get_redis()
+    logger.info("🔌 Shared HTTP session and Redis client opened")
+    yield
+    await close_redis()
+    await close_http_session()
+    logger.info("🔌 Shared HTTP session and Redis client closed")
+
+app = FastAPI(
+    title="Multi-Agent Flashcard API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,7 +48,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-jobs: Dict[str, Dict] = {}
+RATE_LIMIT_PER_MINUTE = 10
+
+
+async def check_rate_limit(user_id: Optional[str]):
+    """Fixed-window limiter in Redis keyed per user (10 req/min).
+
+    Keeps one noisy tenant from starving everyone else's queue slots.
+    Fails open if Redis is unreachable — generation errors will surface
+    on their own.
+    """
+    key = f"rl:{user_id or 'anonymous'}:{datetime.now().strftime('%Y%m%d%H%M')}"
+    try:
+        client = get_redis()
+        count = await client.incr(key)
+        if count == 1:
+            await client.expire(key, 60)
+    except Exception as e:
+        logger.warning(f"⚠️ Rate limit check skipped (Redis error: {e})")
+        return
+
+    if count > RATE_LIMIT_PER_MINUTE:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded: {RATE_LIMIT_PER_MINUTE} requests/minute per user"
+        )
+
 
 class FlashcardRequest(BaseModel):
     text: str
@@ -56,19 +105,29 @@ async def health_check():
     return {"status": "healthy"}
 
 @app.post("/generate-flashcards", response_model=FlashcardResponse)
-async def create_flashcard_job(request: FlashcardRequest, background_tasks: BackgroundTasks):
+async def create_flashcard_job(request: FlashcardRequest):
+    await check_rate_limit(request.user_id)
+
     job_id = str(uuid.uuid4())
-    
-    jobs[job_id] = {
-        "status": "pending",
-        "progress": "Job created",
-        "result": None,
-        "error_message": None,
-        "created_at": datetime.now().isoformat(),
-        "completed_at": None,
-    }
-    
-    background_tasks.add_task(process_flashcard_job, job_id, request.text)
+
+    await save_job(
+        job_id,
+        status="pending",
+        progress="Job created",
+        result=None,
+        error_message=None,
+        created_at=datetime.now().isoformat(),
+        completed_at=None,
+    )
+
+    # Hand the LLM work to the Celery pool so the API process stays
+    # lightweight; the worker updates the job hash as it progresses.
+    # Shorter inputs jump the queue (approximate shortest-job-first).
+    generate_flashcards_task.apply_async(
+        args=[request.text],
+        task_id=job_id,
+        priority=job_priority(request.text),
+    )
     
     return FlashcardResponse(
         job_id=job_id,
@@ -78,62 +137,75 @@ async def create_flashcard_job(request: FlashcardRequest, background_tasks: Back
 
 @app.get("/job-status/{job_id}", response_model=JobStatus)
 async def get_job_status(job_id: str):
-    if job_id not in jobs:
+    job = await load_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    
-    job = jobs[job_id]
+
     return JobStatus(
         job_id=job_id,
         status=job["status"],
-        progress=job.get("progress"),
+        progress=job.get("progress") or None,
         result=job.get("result"),
-        error_message=job.get("error_message")
+        error_message=job.get("error_message") or None
     )
 
 @app.get("/job-result/{job_id}", response_model=FlashcardResult)
 async def get_job_result(job_id: str):
-    if job_id not in jobs:
+    job = await load_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    
-    job = jobs[job_id]
+
     if job["status"] != "completed":
         raise HTTPException(status_code=400, detail="Job not completed yet")
-    
+
     if not job["result"]:
         raise HTTPException(status_code=404, detail="No result found")
-    
+
     return FlashcardResult(
         job_id=job_id,
         flashcards=job["result"],
-        processing_time=job.get("processing_time")
+        processing_time=float(job["processing_time"]) if job.get("processing_time") else None
     )
 
-async def process_flashcard_job(job_id: str, text: str):
-    try:
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress"] = "Starting multi-agent processing..."
-        
-        start_time = datetime.now()
-        result = await generate_anki_cards(text)
-        
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["progress"] = "Processing completed"
-        jobs[job_id]["result"] = result
-        jobs[job_id]["completed_at"] = datetime.now().isoformat()
-        jobs[job_id]["processing_time"] = (datetime.now() - start_time).total_seconds()
-        
-        logger.info(f"✅ Completed job {job_id}")
-        
-    except Exception as e:
-        jobs[job_id]["status"] = "error"
-        jobs[job_id]["error_message"] = str(e)
-        jobs[job_id]["completed_at"] = datetime.now().isoformat()
-        logger.error(f"❌ Job {job_id} failed: {e}")
+@app.get("/job-events/{job_id}")
+async def job_events(job_id: str):
+    """Push job status changes as SSE instead of having clients poll"""
+    job = await load_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(f"job:{job_id}:events")
+        try:
+            # Re-read the hash only after subscribing: any transition
+            # published in between is then covered either by this
+            # snapshot or by the subscription, so none can be missed.
+            snapshot = await load_job(job_id) or job
+            current = {"status": snapshot["status"], "progress": snapshot.get("progress") or None}
+            yield b"data: " + orjson.dumps(current) + b"\n\n"
+            if snapshot["status"] in ("completed", "error"):
+                return
+
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event = orjson.loads(message["data"])
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+                if event.get("status") in ("completed", "error"):
+                    return
+        finally:
+            await pubsub.unsubscribe(f"job:{job_id}:events")
+            await pubsub.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
 @app.post("/generate-flashcards-sync")
 async def generate_flashcards_sync(request: FlashcardRequest):
     """Synchronous endpoint that directly returns flashcards without job polling"""
+    await check_rate_limit(request.user_id)
+
     try:
         logger.info(f"🔄 Direct flashcard generation for text: {request.text[:100]}...")
         
@@ -158,6 +230,35 @@ async def generate_flashcards_sync(request: FlashcardRequest):
         logger.error(f"❌ Direct generation failed: {e}")
         raise HTTPException(status_code=500, detail=f"Flashcard generation failed: {str(e)}")
 
+@app.post("/stream-flashcards")
+async def stream_flashcards(request: FlashcardRequest):
+    """Stream flashcards as SSE events, one event per completed card"""
+    await check_rate_limit(request.user_id)
+
+    async def event_stream():
+        count = 0
+        try:
+            async for card in stream_anki_cards(request.text):
+                count += 1
+                yield b"data: " + orjson.dumps({'event': 'card', 'index': count, 'card': card}) + b"\n\n"
+            yield b"data: " + orjson.dumps({'event': 'done', 'count': count}) + b"\n\n"
+        except Exception as e:
+            logger.error(f"❌ Streaming generation failed: {e}")
+            yield b"data: " + orjson.dumps({'event': 'error', 'message': str(e)}) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # uvloop/httptools swap the pure-Python event loop and HTTP parser
+    # for C implementations (uvloop is not available on Windows); with
+    # job state in Redis, multiple workers can share the load.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "4")),
+    )
\ No newline at end of file
@@ -1,108 +1,363 @@
 import aiohttp
-import json
+import orjson
 import asyncio
-import re
+import hashlib
+import os
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+from redis_client import get_redis
+
+load_dotenv()
+
+
+# ==========================================================
+#  Shared HTTP session (one pooled connection per process)
+# ==========================================================
+_http_session: aiohttp.ClientSession = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Return the shared ClientSession, creating it on first use.
+
+    A single session with a keep-alive connector avoids paying the
+    TCP handshake + DNS cost on every Ollama call.
+    """
+    global _http_session
+
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=128,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+            ),
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared session (called from FastAPI shutdown)."""
+    global _http_session
+
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
 
 
 # ==========================================================
 #  Helper: try to turn messy model output into valid JSON
 # ==========================================================
+def _extract_json_slice(text: str):
+    """Locate the outermost JSON value ([...] or {...}) in one forward scan.
+
+    Tracks bracket depth and string/escape state (so brackets inside
+    strings don't count). Returns the balanced slice; if generation was
+    cut off mid-value, the open brackets are closed in nesting order.
+    Returns None when no value starts at all. Linear in the input — no
+    backtracking, no extra copies.
+    """
+    start = None
+    stack = []
+    in_string = False
+    escape = False
+
+    for i, ch in enumerate(text):
+        if start is None:
+            if ch in "[{":
+                start = i
+                stack.append("]" if ch == "[" else "}")
+            continue
+
+        if escape:
+            escape = False
+            continue
+        if in_string:
+            if ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            stack.append("]" if ch == "[" else "}")
+        elif ch in "]}":
+            stack.pop()
+            if not stack:
+                return text[start:i + 1]
+
+    if start is None:
+        return None
+
+    # Truncated mid-value: close the string and any open brackets.
+    return text[start:] + ('"' if in_string else "") + "".join(reversed(stack))
+
+
 def fix_and_parse_json(raw_text: str):
-    print("[DEBUG] Attempting to parse JSON...")
+    """Parse model output that is schema-constrained via Ollama's format.
 
-    # Step 1: Try strict parse
+    Strict parse is the expected path; the only residual failure mode is
+    output truncated by the num_predict cap, which the bracket scan can
+    still close and salvage.
+    """
     try:
-        return json.loads(raw_text), "strict"
+        return orjson.loads(raw_text), "strict"
     except Exception as e:
         print("[DEBUG] Strict parse failed:", e)
 
-    cleaned = raw_text.strip()
-    cleaned = re.sub(r"```json|```", "", cleaned).strip()
+    cleaned = _extract_json_slice(raw_text)
+    if cleaned is not None:
+        try:
+            parsed = orjson.loads(cleaned)
+            print("[DEBUG] Truncated JSON salvaged.")
+            return parsed, "repaired"
+        except Exception as e:
+            print("[ERROR] JSON salvage failed:", e)
 
-    # Remove trailing commas
-    cleaned = re.sub(r",\s*([}\]])", r"\1", cleaned)
+    print("[ERROR] Raw model output was:")
+    print(raw_text)
+    return [], "failed"
 
-    # Auto-close array if missing
-    if cleaned.count("[") > cleaned.count("]"):
-        cleaned = cleaned + "]"
 
-    # Auto-close object if missing
-    if cleaned.count("{") > cleaned.count("}"):
-        cleaned = cleaned + "}"
+# ==========================================================
+#                   LOW-LEVEL LLM POST
+# ==========================================================
+# "ollama" talks to Ollama's /api/generate; "openai" talks to any
+# OpenAI-compatible completions server (vLLM with --enable-prefix-caching,
+# llama.cpp server with --parallel/--cont-batching) so concurrent
+# requests share a continuous-batching GPU pass.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3.2:1b")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11435/api/generate")
+OPENAI_COMPLETIONS_URL = os.getenv("OPENAI_COMPLETIONS_URL", "http://localhost:11434/v1/completions")
 
-    # Step 4: Try repaired parse
-    try:
-        parsed = json.loads(cleaned)
-        print("[DEBUG] JSON repaired successfully.")
-        return parsed, "repaired"
-    except Exception as e:
-        print("[ERROR] JSON repair failed:", e)
-        print("[ERROR] Raw model output was:")
-        print(raw_text)
-        return [], "failed"
+# Bounded decoding: 5 flashcards fit comfortably in 512 tokens, and the
+# stop sequences cut the model off if it starts rambling past the JSON.
+OLLAMA_OPTIONS = {
+    "temperature": 0.1,
+    "num_predict": 512,
+    "num_ctx": 2048,
+    "stop": ["```", "\n\n\n"],
+}
+
+# CPU-only deployments: pin ggml's thread count (usually the physical
+# core count) instead of Ollama's conservative default.
+_num_thread = os.getenv("OLLAMA_NUM_THREAD")
+if _num_thread:
+    OLLAMA_OPTIONS["num_thread"] = int(_num_thread)
+
+MAX_ATTEMPTS = 3
+
+# JSON schema passed as Ollama's "format" parameter: decoding is
+# constrained to schema-valid JSON, so no fences, no preamble, and no
+# repair pass on the result.
+_CARD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string"},
+        "answer": {"type": "string"},
+    },
+    "required": ["question", "answer"],
+}
+
+FLASHCARD_FORMAT = {
+    "type": "array",
+    "items": _CARD_SCHEMA,
+    "minItems": 5,
+    "maxItems": 5,
+}
+
+
+def _batch_format(n: int) -> dict:
+    """Schema for a batched response: topic number -> array of cards."""
+    keys = [str(i + 1) for i in range(n)]
+    return {
+        "type": "object",
+        "properties": {key: {"type": "array", "items": _CARD_SCHEMA} for key in keys},
+        "required": keys,
+    }
+
+
+class _JsonStreamScanner:
+    """Tracks bracket depth across streamed fragments.
+
+    Lets us notice the moment the model closes its top-level JSON value,
+    so the stream can be cancelled instead of letting the model ramble.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+
+    def feed(self, fragment: str) -> bool:
+        """Feed a fragment; returns True once the top-level value closed."""
+        for ch in fragment:
+            if self.escape:
+                self.escape = False
+                continue
+            if self.in_string:
+                if ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in "[{":
+                self.depth += 1
+                self.started = True
+            elif ch in "]}":
+                self.depth -= 1
+                if self.started and self.depth <= 0:
+                    return True
+        return False
+
+
+def _build_request(prompt: str, options: dict = None, format: dict = None):
+    """Return (url, payload) for the configured LLM backend."""
+    options = options or OLLAMA_OPTIONS
+
+    if LLM_BACKEND == "openai":
+        payload = {
+            "model": LLM_MODEL,
+            "prompt": prompt,
+            "stream": True,
+            "max_tokens": options.get("num_predict", 512),
+            "temperature": options.get("temperature", 0.1),
+            "stop": options.get("stop"),
+        }
+        if format is not None:
+            # vLLM's structured-output extension to the OpenAI schema.
+            payload["guided_json"] = format
+        return OPENAI_COMPLETIONS_URL, payload
+
+    payload = {
+        "model": LLM_MODEL,
+        "prompt": prompt,
+        "stream": True,
+        "options": options,
+    }
+    if format is not None:
+        payload["format"] = format
+    return OLLAMA_URL, payload
+
+
+def _parse_stream_line(line: bytes):
+    """Decode one streamed line into (fragment, done); None for keep-alives."""
+    line = line.strip()
+    if not line:
+        return None
+
+    if LLM_BACKEND == "openai":
+        # OpenAI-compatible servers stream SSE "data: {...}" lines.
+        if not line.startswith(b"data:"):
+            return None
+        line = line[5:].strip()
+        if line == b"[DONE]":
+            return "", True
+        choice = orjson.loads(line).get("choices", [{}])[0]
+        return choice.get("text", ""), choice.get("finish_reason") is not None
+
+    # Ollama streams NDJSON lines.
+    data = orjson.loads(line)
+    return data.get("response", ""), bool(data.get("done"))
+
+
+async def _post_ollama(prompt: str, options: dict = None, format: dict = None) -> str:
+    """POST a generate request to the LLM and return the raw response text.
+
+    Streams the response token-by-token and cancels generation as soon as
+    the top-level JSON value is balanced, trimming tail latency when the
+    model keeps talking past the closing bracket. Retries up to
+    MAX_ATTEMPTS times with exponential backoff on 5xx, connection errors
+    and timeouts; re-raises the last error on exhaustion.
+    """
+    session = get_http_session()
+    url, payload = _build_request(prompt, options, format)
+
+    # The session-wide 30s timeout is sized for single 512-token
+    # generations; give batched dispatches a proportionally larger
+    # budget instead of timing out and failing the whole batch.
+    num_predict = (options or OLLAMA_OPTIONS).get("num_predict", 512)
+    timeout = aiohttp.ClientTimeout(total=30 * max(1, num_predict / 512))
+
+    last_error = None
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            async with session.post(url, json=payload, timeout=timeout) as response:
+                if response.status >= 500:
+                    last_error = RuntimeError(f"LLM backend returned {response.status}")
+                elif response.status != 200:
+                    raise RuntimeError(f"LLM backend returned {response.status}")
+                else:
+                    scanner = _JsonStreamScanner()
+                    fragments = []
+                    async for line in response.content:
+                        parsed = _parse_stream_line(line)
+                        if parsed is None:
+                            continue
+                        fragment, done = parsed
+                        fragments.append(fragment)
+                        if scanner.feed(fragment):
+                            # JSON is complete; closing the response here
+                            # makes the backend abort the rest of the generation.
+                            print("[DEBUG] JSON closed, cancelling stream early")
+                            break
+                        if done:
+                            break
+                    return "".join(fragments)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_error = e
+
+        print(f"[DEBUG] LLM attempt {attempt + 1} failed: {last_error}")
+        if attempt < MAX_ATTEMPTS - 1:
+            await asyncio.sleep(0.5 * 2 ** attempt)
+
+    raise last_error
 
 
 # ==========================================================
 #                   MAIN OLLAMA CALL
 # ==========================================================
-async def super_simple_ollama_flashcards(text: str) -> dict:
-    url = "http://localhost:11435/api/generate"
-
-    prompt = f"""
-    Create exactly 5 technical interview flashcards about this topic: "{text}"
-
-    You MUST return ONLY a JSON array, EXACTLY in this format:
-
-    [
-      {{"question": "What is X?", "answer": "Explanation..."}},
-      {{"question": "How does Y work?", "answer": "Explanation..."}},
-      {{"question": "Why use Z?", "answer": "Explanation..."}},
-      {{"question": "What is W?", "answer": "Explanation..."}},
-      {{"question": "Explain V", "answer": "Explanation..."}}
-    ]
-
-    RULES:
-    - Each item MUST contain "question" and "answer".
-    - No numbering (no Q1, A1).
-    - No nested dictionaries.
-    - No text before or after the JSON.
-    - Do NOT wrap in code fences.
-    """
+def _flashcard_prompt(text: str) -> str:
+    # The format schema already enforces the JSON structure, so the
+    # example/RULES boilerplate (~150 prefill tokens per request) is
+    # gone. Static instruction first, variable topic last, so the
+    # prefix stays cacheable.
+    return f'Create exactly 5 technical interview flashcards with concise answers about the topic: "{text}"'
+
 
+async def super_simple_ollama_flashcards(text: str) -> dict:
     try:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-            async with session.post(url, json={
-                "model": "llama3.2:1b",
-                "prompt": prompt,
-                "stream": False,
-                "options": {"temperature": 0.1}
-            }) as response:
-
-                if response.status == 200:
-                    data = await response.json()
-                    response_text = data['response']
-
-                    parsed_json, mode = fix_and_parse_json(response_text)
-
-                    return {
-                        "final_raw_output": json.dumps(parsed_json, indent=2),
-                        "parsed_cards": parsed_json,
-                        "json_parse_mode": mode,
-                        "method": "direct_ollama",
-                        "status": "success"
-                    }
-
-                return {
-                    "final_raw_output": json.dumps([{"question": "Error", "answer": "Ollama unavailable"}]),
-                    "parsed_cards": [],
-                    "json_parse_mode": "error",
-                    "method": "error",
-                    "status": "failed"
-                }
+        response_text = await _post_ollama(_flashcard_prompt(text), format=FLASHCARD_FORMAT)
+
+        # Parse in a thread so a large output can't stall the event loop
+        # for every other in-flight request.
+        loop = asyncio.get_running_loop()
+        parsed_json, mode = await loop.run_in_executor(None, fix_and_parse_json, response_text)
+
+        # An unparseable or empty response is a failure, not a success —
+        # downstream caching keys off this status.
+        ok = mode != "failed" and bool(parsed_json)
+
+        return {
+            "final_raw_output": orjson.dumps(parsed_json, option=orjson.OPT_INDENT_2).decode(),
+            "parsed_cards": parsed_json,
+            "json_parse_mode": mode,
+            "method": "direct_ollama",
+            "status": "success" if ok else "failed"
+        }
 
     except Exception as e:
         return {
-            "final_raw_output": json.dumps([{"question": "Error", "answer": str(e)}]),
+            "final_raw_output": orjson.dumps([{"question": "Error", "answer": str(e)}]).decode(),
             "parsed_cards": [],
             "json_parse_mode": "exception",
             "method": "exception",
@@ -110,16 +365,370 @@ async def super_simple_ollama_flashcards(text: str) -> dict:
         }
 
 
+# ==========================================================
+#             BATCHED OLLAMA CALL (many topics, one pass)
+# ==========================================================
+async def batched_ollama_flashcards(topics: list) -> list:
+    """Generate flashcards for several topics with a single Ollama call.
+
+    Returns one result dict per topic, in the same order and shape as
+    super_simple_ollama_flashcards.
+    """
+    numbered = "\n".join(f'{i + 1}) "{topic}"' for i, topic in enumerate(topics))
+
+    # Structure comes from the batch format schema; the prompt only needs
+    # the task and the numbered topics.
+    prompt = (
+        "Create exactly 5 technical interview flashcards with concise answers "
+        "for EACH of these numbered topics, as a JSON object keyed by topic number:\n"
+        f"{numbered}"
+    )
+
+    def _failure(reason: str) -> dict:
+        return {
+            "final_raw_output": orjson.dumps([{"question": "Error", "answer": reason}]).decode(),
+            "parsed_cards": [],
+            "json_parse_mode": "error",
+            "method": "batched_ollama",
+            "status": "failed"
+        }
+
+    try:
+        # Scale the output budget with batch size (5 cards per topic)
+        # and grow the context window with it — otherwise a full batch's
+        # 4096-token output blows past the default num_ctx of 2048 and
+        # later topics get truncated away. Prompt headroom is sized from
+        # the actual prompt (topics can be up to 2000 chars each, not
+        # just 500-char chunks): ~3 chars/token plus margin.
+        num_predict = 512 * len(topics)
+        prompt_tokens = len(prompt) // 3 + 256
+        options = {
+            **OLLAMA_OPTIONS,
+            "num_predict": num_predict,
+            "num_ctx": prompt_tokens + num_predict,
+        }
+        response_text = await _post_ollama(prompt, options=options, format=_batch_format(len(topics)))
+
+        # Batched outputs are the largest ones; keep the parse off the loop.
+        loop = asyncio.get_running_loop()
+        parsed_json, mode = await loop.run_in_executor(None, fix_and_parse_json, response_text)
+
+        if not isinstance(parsed_json, dict):
+            return [_failure("Batched response was not a JSON object")] * len(topics)
+
+        results = []
+        for i in range(len(topics)):
+            cards = parsed_json.get(str(i + 1), [])
+            if isinstance(cards, list) and cards:
+                results.append({
+                    "final_raw_output": orjson.dumps(cards, option=orjson.OPT_INDENT_2).decode(),
+                    "parsed_cards": cards,
+                    "json_parse_mode": mode,
+                    "method": "batched_ollama",
+                    "status": "success"
+                })
+            else:
+                results.append(_failure(f"No cards returned for topic {i + 1}"))
+        return results
+
+    except Exception as e:
+        return [_failure(str(e))] * len(topics)
+
+
+# ==========================================================
+#  Micro-batcher: coalesce concurrent calls into one GPU pass
+# ==========================================================
+MAX_BATCH = 8
+MAX_WAIT_MS = 50
+
+_batch_queue: asyncio.Queue = None
+_batch_worker_task = None
+_batch_loop = None
+# Strong refs to in-flight dispatch tasks (create_task results are
+# otherwise garbage-collectable mid-flight).
+_dispatch_tasks = set()
+
+
+def _ensure_batch_worker():
+    global _batch_queue, _batch_worker_task, _batch_loop
+
+    loop = asyncio.get_running_loop()
+    if _batch_loop is not loop:
+        # Fresh event loop (tests, worker restart) -> fresh queue/worker.
+        _batch_queue = asyncio.Queue()
+        _batch_worker_task = None
+        _batch_loop = loop
+
+    if _batch_worker_task is None or _batch_worker_task.done():
+        _batch_worker_task = loop.create_task(_batch_worker())
+
+
+async def _batch_worker():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await _batch_queue.get()]
+
+        # Collect whatever else arrives within the batching window.
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Fire the batch without awaiting it: the worker goes straight
+        # back to draining the queue, so independent batches overlap
+        # instead of serializing behind one in-flight LLM call.
+        task = loop.create_task(_dispatch_batch(batch))
+        _dispatch_tasks.add(task)
+        task.add_done_callback(_dispatch_tasks.discard)
+
+
+async def _dispatch_batch(batch: list):
+    topics = [topic for topic, _ in batch]
+
+    if len(batch) == 1:
+        results = [await super_simple_ollama_flashcards(topics[0])]
+    else:
+        print(f"[DEBUG] Dispatching micro-batch of {len(batch)} topics")
+        results = await batched_ollama_flashcards(topics)
+
+    for (_, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
+
+
+async def queue_flashcard_job(topic: str) -> dict:
+    """Enqueue a topic for the micro-batcher and await its result."""
+    _ensure_batch_worker()
+
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((topic, future))
+    return await future
+
+
+# ==========================================================
+#        STREAMING CALL (yields cards as they complete)
+# ==========================================================
+async def stream_anki_cards(text: str):
+    """Async generator yielding flashcards one by one as Ollama streams.
+
+    Tracks bracket depth over the token stream and parses each top-level
+    object of the array the moment it closes; cancels the stream once the
+    array itself closes.
+    """
+    session = get_http_session()
+    url, payload = _build_request(_flashcard_prompt(text), format=FLASHCARD_FORMAT)
+
+    chars = []
+    depth = 0
+    in_string = False
+    escape = False
+    card_start = None
+
+    async with session.post(url, json=payload) as response:
+        if response.status != 200:
+            raise RuntimeError(f"LLM backend returned {response.status}")
+
+        async for line in response.content:
+            parsed = _parse_stream_line(line)
+            if parsed is None:
+                continue
+            fragment, done = parsed
+
+            for ch in fragment:
+                chars.append(ch)
+                pos = len(chars) - 1
+
+                if escape:
+                    escape = False
+                    continue
+                if in_string:
+                    if ch == "\\":
+                        escape = True
+                    elif ch == '"':
+                        in_string = False
+                    continue
+
+                if ch == '"':
+                    in_string = True
+                elif ch in "[{":
+                    depth += 1
+                    if ch == "{" and depth == 2:
+                        card_start = pos
+                elif ch in "]}":
+                    depth -= 1
+                    if ch == "}" and depth == 1 and card_start is not None:
+                        try:
+                            card = orjson.loads("".join(chars[card_start:pos + 1]))
+                            yield card
+                        except Exception as e:
+                            print("[DEBUG] Skipping malformed streamed card:", e)
+                        card_start = None
+                    elif depth <= 0:
+                        # Array closed; drop the connection so the
+                        # backend stops generating.
+                        return
+
+            if done:
+                return
+
+
+# ==========================================================
+#     LONG INPUTS: split into chunks and fan out in parallel
+# ==========================================================
+LONG_INPUT_THRESHOLD = 2000
+CHUNK_CHAR_LIMIT = 500
+
+
+def _split_topic_chunks(text: str) -> list:
+    """Split a long input into <=500-char chunks on paragraph boundaries.
+
+    Oversized paragraphs are hard-split so no chunk exceeds the limit.
+    """
+    chunks = []
+    current = ""
+
+    for para in text.split("\n\n"):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > CHUNK_CHAR_LIMIT:
+            chunks.append(para[:CHUNK_CHAR_LIMIT])
+            para = para[CHUNK_CHAR_LIMIT:].strip()
+        if not para:
+            continue
+        if current and len(current) + len(para) + 2 > CHUNK_CHAR_LIMIT:
+            chunks.append(current)
+            current = para
+        else:
+            current = f"{current}\n\n{para}" if current else para
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _merge_chunk_results(results: list) -> dict:
+    """Concatenate per-chunk cards, deduplicating repeated questions."""
+    seen = set()
+    cards = []
+    for result in results:
+        for card in result.get("parsed_cards", []):
+            question = str(card.get("question", "")).strip().lower()
+            if question and question not in seen:
+                seen.add(question)
+                cards.append(card)
+
+    ok = any(r.get("status") == "success" for r in results)
+    return {
+        "final_raw_output": orjson.dumps(cards, option=orjson.OPT_INDENT_2).decode(),
+        "parsed_cards": cards,
+        "json_parse_mode": "strict" if ok else "failed",
+        "method": "chunked_parallel",
+        "status": "success" if ok else "failed",
+    }
+
+
+# ==========================================================
+#          RESULT CACHE (hash of input -> Redis payload)
+# ==========================================================
+CACHE_TTL_SECONDS = 86400
+
+# Bounded in-process L1 in front of Redis: hits skip even the Redis
+# round-trip, entries self-evict after an hour, and maxsize caps memory
+# no matter how much traffic arrives.
+_local_cache = TTLCache(maxsize=10000, ttl=3600)
+
+
+def _cache_key(input_text: str) -> str:
+    return "fc:" + hashlib.sha256(input_text.strip().lower().encode()).hexdigest()
+
+
+async def _cache_get(key: str):
+    cached = _local_cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        cached = await get_redis().get(key)
+        if cached:
+            payload = orjson.loads(cached)
+            _local_cache[key] = payload
+            return payload
+    except Exception as e:
+        print("[DEBUG] Cache read failed:", e)
+    return None
+
+
+async def _cache_set(key: str, payload: dict):
+    _local_cache[key] = payload
+    try:
+        await get_redis().set(key, orjson.dumps(payload), ex=CACHE_TTL_SECONDS)
+    except Exception as e:
+        print("[DEBUG] Cache write failed:", e)
+
+
 # ==========================================================
 #                   WRAPPER FUNCTION
 # ==========================================================
+# Single-flight registry: cache key -> future of the in-progress call.
+_in_flight: dict = {}
+
+
 async def generate_anki_cards(input_text: str) -> dict:
     print("[DEBUG] generate_anki_cards() called")
     print(f"[DEBUG] Input length: {len(input_text)} chars")
 
-    result = await super_simple_ollama_flashcards(input_text)
+    # A cache hit replaces seconds of generation with one Redis GET.
+    key = _cache_key(input_text)
+    cached = await _cache_get(key)
+    if cached is not None:
+        print("[DEBUG] Cache hit, skipping generation")
+        return cached
 
-    print("[DEBUG] super_simple_ollama_flashcards() returned keys:", list(result.keys()))
+    # Single-flight: if an identical input is already being generated,
+    # piggyback on it instead of firing another LLM call (closes the
+    # thundering-herd window the cache alone can't cover).
+    existing = _in_flight.get(key)
+    if existing is not None:
+        print("[DEBUG] Identical request in flight, awaiting shared result")
+        return await existing
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[key] = future
+    try:
+        payload = await _generate_payload(input_text, key)
+        future.set_result(payload)
+        return payload
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        # Leader cancelled (CancelledError skips the except above):
+        # cancel the future too so piggybacked waiters don't hang on a
+        # pending future that just left the registry.
+        if not future.done():
+            future.cancel()
+        del _in_flight[key]
+
+
+async def _generate_payload(input_text: str, key: str) -> dict:
+    if len(input_text) > LONG_INPUT_THRESHOLD:
+        # Fan the chunks out concurrently; the micro-batcher coalesces
+        # them into batched calls, so wall time stays near one pass.
+        chunks = _split_topic_chunks(input_text)
+        print(f"[DEBUG] Long input split into {len(chunks)} chunks")
+        chunk_results = await asyncio.gather(*[queue_flashcard_job(c) for c in chunks])
+        result = _merge_chunk_results(chunk_results)
+    else:
+        result = await queue_flashcard_job(input_text)
+
+    print("[DEBUG] queue_flashcard_job() returned keys:", list(result.keys()))
     print("[DEBUG] Raw output length:", len(result.get("final_raw_output", "")))
     print("[DEBUG] JSON parse mode:", result.get("json_parse_mode"))
 
@@ -133,6 +742,10 @@ async def generate_anki_cards(input_text: str) -> dict:
         "json_parse_mode": result["json_parse_mode"],
     }
 
+    # Only successful generations are worth replaying for 24h.
+    if result.get("status") == "success":
+        await _cache_set(key, payload)
+
     print("[DEBUG] Final payload prepared.")
     return payload
 
@@ -140,7 +753,14 @@ async def generate_anki_cards(input_text: str) -> dict:
 # ==========================================================
 #                   Local test
 # ==========================================================
+async def _local_test():
+    try:
+        return await generate_anki_cards("prepare for java technical interview")
+    finally:
+        await close_http_session()
+
+
 if __name__ == "__main__":
-    r = asyncio.run(generate_anki_cards("prepare for java technical interview"))
+    r = asyncio.run(_local_test())
     print("=== FINAL ===")
-    print(json.dumps(r, indent=2))
+    print(orjson.dumps(r, option=orjson.OPT_INDENT_2).decode())
@@ -0,0 +1,76 @@
+import os
+
+import orjson
+from typing import Dict, Optional
+
+import redis.asyncio as redis
+from dotenv import load_dotenv
+
+# REDIS_URL is evaluated at import time, so .env must be loaded here —
+# relying on a later importer's load_dotenv() silently drops the setting.
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+_redis: redis.Redis = None
+
+
+def get_redis() -> redis.Redis:
+    """Return the shared async Redis client, creating it on first use."""
+    global _redis
+
+    if _redis is None:
+        _redis = redis.from_url(REDIS_URL, decode_responses=True)
+
+    return _redis
+
+
+async def close_redis():
+    """Close the shared client (called from FastAPI shutdown)."""
+    global _redis
+
+    if _redis is not None:
+        await _redis.aclose()
+    _redis = None
+
+
+JOB_TTL_SECONDS = 3600
+
+
+async def save_job(job_id: str, **fields):
+    """Write job fields to the Redis hash and refresh its TTL.
+
+    Dict values (the result payload) are stored as JSON strings since
+    Redis hashes only hold flat string values.
+    """
+    key = f"job:{job_id}"
+    mapping = {
+        k: orjson.dumps(v).decode() if isinstance(v, dict) else ("" if v is None else str(v))
+        for k, v in fields.items()
+    }
+    client = get_redis()
+    await client.hset(key, mapping=mapping)
+    await client.expire(key, JOB_TTL_SECONDS)
+
+    # Push the transition to anyone following the job over SSE, so the
+    # frontend doesn't have to poll /job-status. The (large) result
+    # payload stays out of the event; subscribers fetch it on "completed".
+    event = {
+        k: fields[k]
+        for k in ("status", "progress", "error_message", "processing_time")
+        if k in fields and fields[k] is not None
+    }
+    if event:
+        await client.publish(f"job:{job_id}:events", orjson.dumps(event))
+
+
+async def load_job(job_id: str) -> Optional[Dict]:
+    """Read a job hash back; returns None if the job is unknown/expired."""
+    job = await get_redis().hgetall(f"job:{job_id}")
+    if not job:
+        return None
+    if job.get("result"):
+        job["result"] = orjson.loads(job["result"])
+    else:
+        job["result"] = None
+    return job
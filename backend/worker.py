@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from celery import Celery
+
+from multi_agent_system import generate_anki_cards
+from redis_client import REDIS_URL, save_job
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+celery_app = Celery("flashcards", broker=REDIS_URL, backend=REDIS_URL)
+celery_app.conf.update(
+    task_track_started=True,
+    broker_connection_retry_on_startup=True,
+    # Emulated priority queues on the Redis broker: priority 0 is drained
+    # first. Prefetch 1 so a worker doesn't grab a backlog of long jobs
+    # ahead of newly arrived short ones.
+    broker_transport_options={
+        "queue_order_strategy": "priority",
+        "priority_steps": list(range(10)),
+    },
+    worker_prefetch_multiplier=1,
+)
+
+
+def job_priority(text: str) -> int:
+    """Shortest-job-first approximation: input length predicts LLM time.
+
+    Short inputs map to priority 0 (drained first on the Redis broker),
+    so a 50-page dump can't head-of-line block quick requests.
+    """
+    return min(9, len(text) // 500)
+
+# One long-lived event loop per worker process so the pooled aiohttp
+# session and Redis client are reused across tasks instead of being
+# rebuilt by a fresh asyncio.run() every time.
+_loop: asyncio.AbstractEventLoop = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+
+    return _loop
+
+
+async def _run_flashcard_job(job_id: str, text: str) -> dict:
+    try:
+        await save_job(
+            job_id,
+            status="processing",
+            progress="Starting multi-agent processing...",
+        )
+
+        start_time = datetime.now()
+        result = await generate_anki_cards(text)
+
+        await save_job(
+            job_id,
+            status="completed",
+            progress="Processing completed",
+            result=result,
+            completed_at=datetime.now().isoformat(),
+            processing_time=(datetime.now() - start_time).total_seconds(),
+        )
+
+        logger.info(f"✅ Completed job {job_id}")
+        return result
+
+    except Exception as e:
+        await save_job(
+            job_id,
+            status="error",
+            error_message=str(e),
+            completed_at=datetime.now().isoformat(),
+        )
+        logger.error(f"❌ Job {job_id} failed: {e}")
+        raise
+
+
+@celery_app.task(name="tasks.generate_flashcards_task", bind=True)
+def generate_flashcards_task(self, text: str):
+    return _get_loop().run_until_complete(_run_flashcard_job(self.request.id, text))